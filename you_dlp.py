@@ -9,6 +9,10 @@ from pathlib import Path  # For cross-platform file paths
 import tempfile  # For temporary files (not used directly here)
 import logging  # For logging errors and info
 import subprocess  # For running system commands (FFmpeg check)
+import time  # For throttling progress updates
+import threading  # For attaching the Streamlit context to download threads
+from concurrent.futures import ThreadPoolExecutor  # For downloading video and audio concurrently
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx  # For UI updates from threads
 
 
 # Configure logging for debugging and error tracking
@@ -16,6 +20,32 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# YouTube extractor arguments, built once instead of per yt_dlp call
+_EXTRACTOR_ARGS = {
+    'youtube': {
+        'player_client': ('web', 'android'),  # Use web and android clients for extraction
+        'skip': ('dash', 'hls')  # Skip certain streaming formats
+    }
+}
+
+# Common yt_dlp options shared by every extraction and download call
+_BASE_YDL_OPTS = {
+    'quiet': True,  # Suppress yt_dlp output
+    'no_warnings': True,
+    # Make templated filenames safe on all operating systems
+    'windowsfilenames': True,
+    'extractor_args': _EXTRACTOR_ARGS
+}
+
+
+# Single regex covering all supported YouTube URL types (watch, youtu.be, embed, v),
+# compiled once at import time so the shared https?:// prefix is only matched once
+_YT_RE = re.compile(
+    r'^https?://(?:(?:www\.|m\.)?youtube\.com/(?:watch\?v=|embed/|v/)|(?:www\.)?youtu\.be/)'
+    r'([a-zA-Z0-9_-]{11})'
+)
+
+
 def is_valid_url(url):
     """
     Check if the provided URL is a valid YouTube video URL.
@@ -24,22 +54,22 @@ def is_valid_url(url):
     """
     if not url:
         return False
-    # List of regex patterns for different YouTube URL types
-    patterns = [
-        r'^https?://(?:www\.)?youtube\.com/watch\?v=([a-zA-Z0-9_-]{11})',
-        r'^https?://(?:www\.)?youtu\.be/([a-zA-Z0-9_-]{11})',
-        r'^https?://(?:www\.)?youtube\.com/embed/([a-zA-Z0-9_-]{11})',
-        r'^https?://(?:www\.)?youtube\.com/v/([a-zA-Z0-9_-]{11})',
-        r'^https?://(?:m\.)?youtube\.com/watch\?v=([a-zA-Z0-9_-]{11})'
-    ]
-    # Check if any pattern matches the input URL
-    return any(re.match(pattern, url.strip()) for pattern in patterns)
+    url = url.strip()
+    # Cheap string checks reject partial or non-YouTube input without running the regex
+    if len(url) < 20 or not url.startswith(('http://', 'https://')):
+        return False
+    if 'youtu' not in url:
+        return False
+    # Check if the combined pattern matches the input URL
+    return _YT_RE.match(url) is not None
 
 
+@st.cache_resource
 def check_ffmpeg():
     """
     Check if FFmpeg is installed and available in the system PATH.
     Returns (True, version_info) if found, otherwise (False, error_message).
+    The result is cached so the FFmpeg probe only runs once, not on every Streamlit rerun.
     """
     try:
         # Run 'ffmpeg -version' and capture output
@@ -53,33 +83,35 @@ def check_ffmpeg():
         return False, "FFmpeg not found"
 
 
+@st.cache_data(ttl=600, show_spinner=False)
+def _extract(url):
+    """
+    Run a single yt_dlp metadata extraction for a URL and return the sanitized info dict.
+    Shared by get_video_info and get_video_formats so each URL is only fetched once.
+    Errors are raised rather than cached, so a failed lookup is retried on the next rerun.
+    """
+    # Pass a copy since YoutubeDL fills in defaults on the params dict it is given
+    with yt_dlp.YoutubeDL(dict(_BASE_YDL_OPTS)) as ydl:
+        return ydl.sanitize_info(ydl.extract_info(url, download=False))
+
+
 def get_video_info(url):
     """
     Retrieve basic information about a YouTube video (title, duration, uploader, etc).
     Returns a dictionary with video info, or None if extraction fails.
     """
-    ydl_opts = {
-        'quiet': True,  # Suppress yt_dlp output
-        'no_warnings': True,
-        'extractor_args': {
-            'youtube': {
-                'player_client': ['web', 'android'],  # Use web and android clients for extraction
-                'skip': ['dash', 'hls']  # Skip certain streaming formats
-            }
-        }
-    }
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            return {
-                'title': info.get('title', 'Unknown Title'),
-                'duration': info.get('duration', 0),
-                'uploader': info.get('uploader', 'Unknown'),
-                'id': info.get('id', ''),
-                'thumbnail': info.get('thumbnail', ''),
-                # Truncate description for display
-                'description': info.get('description', '')[:200] + '...' if info.get('description') else ''
-            }
+        info = _extract(url)
+        desc = info.get('description') or ''
+        return {
+            'title': info.get('title', 'Unknown Title'),
+            'duration': info.get('duration', 0),
+            'uploader': info.get('uploader', 'Unknown'),
+            'id': info.get('id', ''),
+            'thumbnail': info.get('thumbnail', ''),
+            # Truncate description for display
+            'description': (desc[:200] + '...') if desc else ''
+        }
     except Exception as e:
         logger.error(f"Error getting video info: {e}")
         return None
@@ -91,124 +123,136 @@ def get_video_formats(url, show_all=False):
     Returns a list of dictionaries describing each format (quality, merge info, etc).
     show_all: If True, includes audio-only and video-only formats.
     """
-    ydl_opts = {
-        'quiet': True,  # Suppress yt_dlp output
-        'no_warnings': True,
-        'listformats': True,  # List all formats
-        'extractor_args': {
-            'youtube': {
-                'player_client': ['web', 'android'],
-                'skip': ['dash', 'hls']
-            }
-        }
-    }
-
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            result = ydl.extract_info(url, download=False)
-            # If no formats found, return empty list
-            if not result or 'formats' not in result:
-                return []
-            formats = []
-            seen_formats = set()
-
-            # Find the best audio-only format (for merging with video-only formats)
-            audio_formats = [f for f in result['formats'] if f.get('acodec') != 'none' and f.get('vcodec') == 'none']
-            best_audio = max(audio_formats, key=lambda x: x.get('abr', 0)) if audio_formats else None
-
-            # Sort formats by quality (height, width, bitrate)
-            sorted_formats = sorted(
-                result['formats'], 
-                key=lambda x: (x.get('height', 0), x.get('width', 0), x.get('tbr', 0)), 
-                reverse=True
-            )
-
-            for f in sorted_formats:
-                if not f or not f.get('format_id'):
-                    continue
-                format_id = f.get('format_id', '')
-                vcodec = f.get('vcodec', 'none')
-                acodec = f.get('acodec', 'none')
-                height = f.get('height')
-                fps = f.get('fps')
-                ext = f.get('ext', 'mp4')
-                filesize = f.get('filesize') or f.get('filesize_approx', 0)
-                vbr = f.get('vbr', 0)
-
-                # Only show video formats by default, unless show_all is True
-                if vcodec == 'none' and not show_all:
-                    continue
-
-                # Build a user-friendly description for each format
-                if vcodec != 'none' and height:
-                    # Video format (with or without audio)
-                    fps_str = f"@{fps}fps" if fps else ""
-                    size_str = f" ({filesize//1024//1024}MB)" if filesize > 0 else ""
-                    if acodec != 'none':
-                        # Video+audio (complete)
-                        quality_desc = f"{height}p{fps_str} ✅ Complete{size_str}"
-                        format_key = f"complete_{height}_{fps or 0}"
-                        merge_needed = False
-                        priority = 1  # Highest priority
-                    else:
-                        # Video-only (needs merging with audio)
-                        audio_info = ""
-                        if best_audio:
-                            audio_info = f" + {best_audio.get('abr', 128)}kbps audio"
-                        quality_desc = f"{height}p{fps_str} 🔄 Auto-merge{audio_info}{size_str}"
-                        format_key = f"video_merge_{height}_{fps or 0}"
-                        merge_needed = True
-                        priority = 2  # Second priority
-                elif acodec != 'none' and show_all:
-                    # Audio-only format (if show_all enabled)
-                    abr = f.get('abr', 'unknown')
-                    quality_desc = f"🎵 Audio Only - {abr}kbps ({ext.upper()})"
-                    format_key = f"audio_only_{abr}"
+        result = _extract(url)
+        # If no formats found, return empty list
+        if not result or 'formats' not in result:
+            return []
+        # Single pass: keep only the highest quality format per quality bucket,
+        # and track the best audio-only format (for merging with video-only formats)
+        best_per_key = {}
+        best_audio = None
+        for index, f in enumerate(result['formats']):
+            if not f or not f.get('format_id'):
+                continue
+            vcodec = f.get('vcodec', 'none')
+            acodec = f.get('acodec', 'none')
+            height = f.get('height') or 0
+            fps = f.get('fps') or 0
+
+            if acodec != 'none' and vcodec == 'none':
+                if best_audio is None or (f.get('abr') or 0) > (best_audio.get('abr') or 0):
+                    best_audio = f
+
+            # Only show video formats by default, unless show_all is True
+            if vcodec == 'none' and not show_all:
+                continue
+
+            # Work out which quality bucket this format belongs to
+            if vcodec != 'none' and height:
+                if acodec != 'none':
+                    # Video+audio (complete)
+                    format_key = ('complete', height, fps)
+                else:
+                    # Video-only (needs merging with audio)
+                    format_key = ('video_merge', height, fps)
+            elif acodec != 'none' and show_all:
+                # Audio-only format (if show_all enabled)
+                format_key = ('audio_only', f.get('abr', 'unknown'))
+            else:
+                continue
+
+            # Avoid duplicate entries for the same quality: keep the best (height, width, bitrate)
+            rank = (height, f.get('width') or 0, f.get('tbr') or 0)
+            current = best_per_key.get(format_key)
+            if current is None or rank > current[0]:
+                best_per_key[format_key] = (rank, index, f)
+
+        # Visit the kept formats best-first (ties in original order), so formats that tie
+        # in the final sort below (e.g. audio-only) stay ordered by quality
+        ranked = sorted(best_per_key.items(), key=lambda item: (item[1][0], -item[1][1]), reverse=True)
+        formats = []
+        for format_key, (rank, index, f) in ranked:
+            format_id = f.get('format_id', '')
+            vcodec = f.get('vcodec', 'none')
+            acodec = f.get('acodec', 'none')
+            height = f.get('height') or 0
+            fps = f.get('fps') or 0
+            ext = f.get('ext', 'mp4')
+            filesize = f.get('filesize') or f.get('filesize_approx', 0)
+
+            # Build a user-friendly description for each format
+            if format_key[0] == 'audio_only':
+                abr = format_key[1]
+                quality_desc = f"🎵 Audio Only - {abr}kbps ({ext.upper()})"
+                merge_needed = False
+                priority = 3  # Lowest priority
+            else:
+                # Video format (with or without audio)
+                fps_str = f"@{fps}fps" if fps else ""
+                size_str = f" ({filesize//1024//1024}MB)" if filesize > 0 else ""
+                if format_key[0] == 'complete':
+                    # Video+audio (complete)
+                    quality_desc = f"{height}p{fps_str} ✅ Complete{size_str}"
                     merge_needed = False
-                    priority = 3  # Lowest priority
+                    priority = 1  # Highest priority
                 else:
-                    continue
-
-                # Avoid duplicate entries for the same quality
-                if format_key not in seen_formats:
-                    seen_formats.add(format_key)
-                    formats.append({
-                        'format_id': format_id,
-                        'resolution': quality_desc,
-                        'has_video': vcodec != 'none',
-                        'has_audio': acodec != 'none',
-                        'height': height or 0,
-                        'ext': ext,
-                        'filesize': filesize,
-                        'merge_needed': merge_needed,
-                        'best_audio_id': best_audio.get('format_id') if best_audio and merge_needed else None,
-                        'priority': priority,
-                        'fps': fps or 0
-                    })
-
-            # Sort formats: complete first, then by quality
-            formats.sort(key=lambda x: (x['priority'], -x['height'], -x['fps']))
-            return formats
+                    # Video-only (needs merging with audio)
+                    audio_info = ""
+                    if best_audio:
+                        audio_info = f" + {best_audio.get('abr', 128)}kbps audio"
+                    quality_desc = f"{height}p{fps_str} 🔄 Auto-merge{audio_info}{size_str}"
+                    merge_needed = True
+                    priority = 2  # Second priority
+
+            formats.append({
+                'format_id': format_id,
+                'resolution': quality_desc,
+                'has_video': vcodec != 'none',
+                'has_audio': acodec != 'none',
+                'height': height,
+                'ext': ext,
+                'filesize': filesize,
+                'merge_needed': merge_needed,
+                'best_audio_id': best_audio.get('format_id') if best_audio and merge_needed else None,
+                'priority': priority,
+                'fps': fps
+            })
+
+        # Sort formats: complete first, then by quality
+        formats.sort(key=lambda x: (x['priority'], -x['height'], -x['fps']))
+        return formats
     except Exception as e:
         logger.error(f"Error fetching formats: {e}")
         st.error(f"❌ Error fetching formats: {str(e)}")
         return []
 
 
-def sanitize_filename(title):
+# Substrings of common yt_dlp download errors mapped to user-friendly messages (checked in order)
+_ERR_MAP = [
+    ('requested format not available', "❌ The selected quality is no longer available. Please try a different quality."),
+    ('video unavailable', "❌ Video is unavailable or private."),
+    ('ffmpeg', "❌ FFmpeg error during merging. Try downloading separately or install FFmpeg."),
+]
+
+
+@st.cache_resource
+def _prepared_dirs():
+    """
+    Return the set of output directories already created and checked for write access.
+    Cached as a resource so it survives Streamlit reruns (module globals are reset on each rerun).
+    """
+    return set()
+
+
+def _download_in_thread(url, ydl_opts, ctx):
     """
-    Clean up the video title to make it safe for use as a filename on all operating systems.
-    Removes illegal characters and trims length.
+    Run a yt_dlp download from a worker thread.
+    Attaches the Streamlit script context so progress hooks can update the UI.
     """
-    if not title:
-        return "video"
-    # Remove illegal filename characters
-    sanitized = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '', title)
-    # Replace multiple spaces with a single space
-    sanitized = re.sub(r'\s+', ' ', sanitized).strip()
-    # Limit filename length
-    sanitized = sanitized[:200] if len(sanitized) > 200 else sanitized
-    return sanitized or "video"
+    add_script_run_ctx(threading.current_thread(), ctx)
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        ydl.download([url])
 
 
 def download_video(url, format_info, output_path, progress_container, progress_bar, merge_option="auto"):
@@ -218,45 +262,67 @@ def download_video(url, format_info, output_path, progress_container, progress_b
     Shows progress in the Streamlit UI.
     Returns True if successful, False otherwise.
     """
-    # Ensure output directory exists
-    try:
-        os.makedirs(output_path, exist_ok=True)
-    except Exception as e:
-        st.error(f"❌ Cannot create output directory: {e}")
-        return False
-
-    # Check write permissions
-    if not os.access(output_path, os.W_OK):
-        st.error(f"❌ No write permission for directory: {output_path}")
-        return False
-
-    # Progress hook for yt_dlp to update Streamlit UI
-    def progress_hook(d):
+    # Only prepare each output directory once (skips repeated syscalls on later downloads)
+    prepared_dirs = _prepared_dirs()
+    if output_path not in prepared_dirs:
+        # Ensure output directory exists
         try:
-            if d['status'] == 'downloading':
-                total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-                downloaded = d.get('downloaded_bytes', 0)
-                filename = d.get('filename', '').split('/')[-1]
-                if total > 0:
-                    percent = min((downloaded / total) * 100, 100)
-                    progress_bar.progress(percent / 100)
-                    progress_container.markdown(f"**📥 Downloading {filename}: {percent:.1f}%**")
-                else:
-                    progress_container.markdown(f"**📥 Downloading {filename}...**")
-            elif d['status'] == 'finished':
-                progress_bar.progress(1.0)
-                progress_container.markdown("**✅ Download complete! Processing...**")
+            os.makedirs(output_path, exist_ok=True)
         except Exception as e:
-            logger.error(f"Progress hook error: {e}")
+            st.error(f"❌ Cannot create output directory: {e}")
+            return False
+
+        # Check write permissions
+        if not os.access(output_path, os.W_OK):
+            st.error(f"❌ No write permission for directory: {output_path}")
+            return False
+        prepared_dirs.add(output_path)
+
+    def make_progress_hook(progress_container, progress_bar):
+        """
+        Build a progress hook for yt_dlp that updates the given Streamlit placeholders.
+        Each hook keeps its own throttling state, so concurrent downloads don't interfere.
+        """
+        # Time of the last UI update and last seen (path, display name), kept in list cells
+        # so the hook can update them
+        last_update = [0.0]
+        last_filename = [None, '']
+
+        def progress_hook(d):
+            try:
+                if d['status'] == 'downloading':
+                    # Throttle UI updates to ~5 per second; each one is a websocket message
+                    now = time.monotonic()
+                    if now - last_update[0] < 0.2:
+                        return
+                    last_update[0] = now
+                    total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
+                    downloaded = d.get('downloaded_bytes', 0)
+                    path = d.get('filename', '')
+                    if path != last_filename[0]:
+                        last_filename[0] = path
+                        last_filename[1] = os.path.basename(path)
+                    filename = last_filename[1]
+                    if total > 0:
+                        percent = min((downloaded / total) * 100, 100)
+                        progress_bar.progress(percent / 100)
+                        progress_container.markdown(f"**📥 Downloading {filename}: {percent:.1f}%**")
+                    else:
+                        progress_container.markdown(f"**📥 Downloading {filename}...**")
+                elif d['status'] == 'finished':
+                    progress_bar.progress(1.0)
+                    progress_container.markdown("**✅ Download complete! Processing...**")
+            except Exception as e:
+                logger.error(f"Progress hook error: {e}")
 
-    # Get video info for filename
-    video_info = get_video_info(url)
-    if not video_info:
-        st.error("❌ Could not retrieve video information")
-        return False
+        return progress_hook
+
+    # Progress hook for yt_dlp to update Streamlit UI
+    progress_hook = make_progress_hook(progress_container, progress_bar)
 
-    # Sanitize the video title for use as a filename
-    safe_title = sanitize_filename(video_info['title'])
+    # Let yt_dlp fill in (and sanitize) the video title for the filename while downloading,
+    # instead of fetching the video info separately just for the title
+    title_template = '%(title).200B'
 
     try:
         format_id = format_info['format_id']
@@ -266,19 +332,12 @@ def download_video(url, format_info, output_path, progress_container, progress_b
         if merge_needed and merge_option == "merge":
             # Download video-only + best audio and merge into a single file
             format_string = f"{format_id}+bestaudio/best"
-            output_template = os.path.join(output_path, f'{safe_title}_merged.%(ext)s')
+            output_template = os.path.join(output_path, f'{title_template}_merged.%(ext)s')
             ydl_opts = {
+                **_BASE_YDL_OPTS,
                 'format': format_string,
                 'outtmpl': output_template,
-                'quiet': True,
-                'no_warnings': True,
                 'progress_hooks': [progress_hook],
-                'extractor_args': {
-                    'youtube': {
-                        'player_client': ['web', 'android'],
-                        'skip': ['dash', 'hls']
-                    }
-                },
                 # Use FFmpeg to merge video and audio into MP4
                 'postprocessors': [
                     {
@@ -292,53 +351,44 @@ def download_video(url, format_info, output_path, progress_container, progress_b
         elif merge_needed and merge_option == "separate":
             # Download video and audio as separate files
             progress_container.markdown("**📥 Downloading video and audio separately...**")
-            # Download video-only
+            # Give the audio download its own progress display so the two don't overwrite each other
+            audio_container = st.empty()
+            audio_bar = st.progress(0)
+            # Video-only
             video_opts = {
+                **_BASE_YDL_OPTS,
                 'format': format_id,
-                'outtmpl': os.path.join(output_path, f'{safe_title}_video.%(ext)s'),
-                'quiet': True,
-                'progress_hooks': [progress_hook],
-                'extractor_args': {
-                    'youtube': {
-                        'player_client': ['web', 'android'],
-                        'skip': ['dash', 'hls']
-                    }
-                }
+                'outtmpl': os.path.join(output_path, f'{title_template}_video.%(ext)s'),
+                'progress_hooks': [progress_hook]
             }
-            with yt_dlp.YoutubeDL(video_opts) as ydl:
-                ydl.download([url])
-            # Download audio-only
+            # Audio-only
             audio_opts = {
+                **_BASE_YDL_OPTS,
                 'format': 'bestaudio',
-                'outtmpl': os.path.join(output_path, f'{safe_title}_audio.%(ext)s'),
-                'quiet': True,
-                'progress_hooks': [progress_hook],
-                'extractor_args': {
-                    'youtube': {
-                        'player_client': ['web', 'android'],
-                        'skip': ['dash', 'hls']
-                    }
-                }
+                'outtmpl': os.path.join(output_path, f'{title_template}_audio.%(ext)s'),
+                'progress_hooks': [make_progress_hook(audio_container, audio_bar)]
             }
-            with yt_dlp.YoutubeDL(audio_opts) as ydl:
-                ydl.download([url])
+            # The two downloads are independent, so run them concurrently
+            ctx = get_script_run_ctx()
+            try:
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    futures = [executor.submit(_download_in_thread, url, opts, ctx)
+                               for opts in (video_opts, audio_opts)]
+                    for future in futures:
+                        future.result()
+            finally:
+                audio_container.empty()
+                audio_bar.empty()
             progress_container.markdown("**🎉 Video and audio downloaded separately!**")
             return True
 
         else:
             # Download as-is (complete format or audio-only)
             ydl_opts = {
+                **_BASE_YDL_OPTS,
                 'format': format_id,
-                'outtmpl': os.path.join(output_path, f'{safe_title}.%(ext)s'),
-                'quiet': True,
-                'no_warnings': True,
-                'progress_hooks': [progress_hook],
-                'extractor_args': {
-                    'youtube': {
-                        'player_client': ['web', 'android'],
-                        'skip': ['dash', 'hls']
-                    }
-                }
+                'outtmpl': os.path.join(output_path, f'{title_template}.%(ext)s'),
+                'progress_hooks': [progress_hook]
             }
 
         # Execute the download (for merged or complete formats)
@@ -351,12 +401,11 @@ def download_video(url, format_info, output_path, progress_container, progress_b
     except yt_dlp.DownloadError as e:
         # Handle common download errors and show user-friendly messages
         error_msg = str(e)
-        if "requested format not available" in error_msg.lower():
-            st.error("❌ The selected quality is no longer available. Please try a different quality.")
-        elif "video unavailable" in error_msg.lower():
-            st.error("❌ Video is unavailable or private.")
-        elif "ffmpeg" in error_msg.lower():
-            st.error("❌ FFmpeg error during merging. Try downloading separately or install FFmpeg.")
+        error_low = error_msg.lower()
+        for needle, friendly_msg in _ERR_MAP:
+            if needle in error_low:
+                st.error(friendly_msg)
+                break
         else:
             st.error(f"❌ Download error: {error_msg}")
         return False
@@ -366,6 +415,85 @@ def download_video(url, format_info, output_path, progress_container, progress_b
         return False
 
 
+@st.fragment
+def _download_panel(selected_format, video_url, download_path, ffmpeg_available, merge_preference):
+    """
+    Show the merge options and download button for the selected format.
+    Runs as a Streamlit fragment, so interacting with it only reruns this panel
+    instead of re-validating the URL and reloading video info and formats.
+    """
+    # If merging is needed, show merge options
+    merge_option = merge_preference
+    if selected_format.get('merge_needed'):
+        st.markdown("#### 🔄 This quality requires merging video + audio")
+
+        if ffmpeg_available:
+            st.success("✅ FFmpeg detected - automatic merging available")
+
+            merge_col1, merge_col2 = st.columns(2)
+
+            with merge_col1:
+                st.info("**🔄 Auto-Merge (Recommended)**\n\nDownloads video + audio and combines them into a single MP4 file")
+
+            with merge_col2:
+                st.info("**📁 Keep Separate**\n\nDownloads video and audio as separate files for manual control")
+
+            # Let user choose merge or separate
+            merge_choice = st.radio(
+                "Select merge option:",
+                ["Auto-merge into single file", "Keep as separate files"],
+                index=0 if merge_preference == "merge" else 1
+            )
+
+            merge_option = "merge" if "Auto-merge" in merge_choice else "separate"
+
+        else:
+            st.warning("⚠️ FFmpeg not found - will download as separate files")
+            st.info("**📁 Separate Files Mode**\n\nVideo and audio will be downloaded as separate files. Install FFmpeg for automatic merging.")
+            merge_option = "separate"
+
+    # Download section
+    st.markdown("### ⬇️ Download")
+
+    if st.button("🚀 Start Download", type="primary", use_container_width=True):
+        progress_container = st.empty()
+        progress_bar = st.progress(0)
+
+        # Show what will happen
+        if selected_format.get('merge_needed'):
+            if merge_option == "merge":
+                st.info("🔄 Will download video and audio, then merge them")
+            else:
+                st.info("📁 Will download video and audio as separate files")
+        else:
+            st.info("📥 Will download complete file")
+
+        # Start the download
+        success = download_video(
+            video_url, 
+            selected_format, 
+            str(download_path),
+            progress_container,
+            progress_bar,
+            merge_option
+        )
+
+        if success:
+            st.balloons()
+            st.success(f"🎉 Download successful!")
+            st.info(f"📁 Files saved to: `{download_path}`")
+
+            # Show what was downloaded
+            if merge_option == "separate" and selected_format.get('merge_needed'):
+                st.info("📄 Downloaded files:\n- Video file (no audio)\n- Audio file")
+                if ffmpeg_available:
+                    st.info("💡 You can manually merge them later using FFmpeg")
+
+        # Clear progress bars
+        progress_container.empty()
+        progress_bar.empty()
+
+
 def main():
     """
     Main function to run the Streamlit YouTube downloader app.
@@ -508,90 +636,16 @@ def main():
                         We automatically combine them for you!
                         """)
 
-                    # Build a mapping from description to format info
-                    format_options = {}
-                    for fmt in formats:
-                        format_options[fmt['resolution']] = fmt
-
-                    # Let user select the desired quality
-                    selected_resolution = st.selectbox(
+                    # Let user select the desired quality (returns the selected format dict)
+                    selected_format = st.selectbox(
                         "Choose video quality:",
-                        options=list(format_options.keys()),
+                        options=formats,
+                        format_func=lambda fmt: fmt['resolution'],
                         help="✅ = Ready to play | 🔄 = Will be merged automatically"
                     )
 
-                    selected_format = format_options[selected_resolution]
-
-                    # If merging is needed, show merge options
-                    merge_option = merge_preference
-                    if selected_format.get('merge_needed'):
-                        st.markdown("#### 🔄 This quality requires merging video + audio")
-
-                        if ffmpeg_available:
-                            st.success("✅ FFmpeg detected - automatic merging available")
-
-                            merge_col1, merge_col2 = st.columns(2)
-
-                            with merge_col1:
-                                st.info("**🔄 Auto-Merge (Recommended)**\n\nDownloads video + audio and combines them into a single MP4 file")
-
-                            with merge_col2:
-                                st.info("**📁 Keep Separate**\n\nDownloads video and audio as separate files for manual control")
-
-                            # Let user choose merge or separate
-                            merge_choice = st.radio(
-                                "Select merge option:",
-                                ["Auto-merge into single file", "Keep as separate files"],
-                                index=0 if merge_preference == "merge" else 1
-                            )
-
-                            merge_option = "merge" if "Auto-merge" in merge_choice else "separate"
-
-                        else:
-                            st.warning("⚠️ FFmpeg not found - will download as separate files")
-                            st.info("**📁 Separate Files Mode**\n\nVideo and audio will be downloaded as separate files. Install FFmpeg for automatic merging.")
-                            merge_option = "separate"
-
-                    # Download section
-                    st.markdown("### ⬇️ Download")
-
-                    if st.button("🚀 Start Download", type="primary", use_container_width=True):
-                        progress_container = st.empty()
-                        progress_bar = st.progress(0)
-
-                        # Show what will happen
-                        if selected_format.get('merge_needed'):
-                            if merge_option == "merge":
-                                st.info("🔄 Will download video and audio, then merge them")
-                            else:
-                                st.info("📁 Will download video and audio as separate files")
-                        else:
-                            st.info("📥 Will download complete file")
-
-                        # Start the download
-                        success = download_video(
-                            video_url, 
-                            selected_format, 
-                            str(download_path),
-                            progress_container,
-                            progress_bar,
-                            merge_option
-                        )
-
-                        if success:
-                            st.balloons()
-                            st.success(f"🎉 Download successful!")
-                            st.info(f"📁 Files saved to: `{download_path}`")
-
-                            # Show what was downloaded
-                            if merge_option == "separate" and selected_format.get('merge_needed'):
-                                st.info("📄 Downloaded files:\n- Video file (no audio)\n- Audio file")
-                                if ffmpeg_available:
-                                    st.info("💡 You can manually merge them later using FFmpeg")
-
-                        # Clear progress bars
-                        progress_container.empty()
-                        progress_bar.empty()
+                    # Merge options and download button rerun on their own (see _download_panel)
+                    _download_panel(selected_format, video_url, download_path, ffmpeg_available, merge_preference)
 
                 else:
                     st.warning("⚠️ No downloadable formats found for this video.")